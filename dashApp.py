@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 """ Dash app for simulating investment portfolio w/ different assets and weights. At the moment only works with ETFs"""
 
+import copy
+import pickle
+import uuid
+
 import dash
 import plotly.express as px
 import dash_core_components as dcc
@@ -8,6 +12,8 @@ import dash_html_components as html
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 from dash.dependencies import Input, Output, State, ALL
+from dash.exceptions import PreventUpdate
+from flask_caching import Cache
 from portfolio import read_portfolio_from_pickle, Portfolio, pd
 
 #   get default data
@@ -17,7 +23,35 @@ w = ptf.summary['weight']
 scaled = ptf.get_scaled_prices()
 
 #   Create app
-app = dash.Dash()
+app = dash.Dash(__name__, compress=True)
+app.server.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+cache = Cache(app.server, config={'CACHE_TYPE': 'filesystem', 'CACHE_DIR': '.cache',
+                                  'CACHE_DEFAULT_TIMEOUT': 0})  # portfolios must not expire mid-session
+
+
+def store_ptf(session_id: str, version: int, portfolio: Portfolio):
+    """
+    Store portfolio in the server-side cache
+    :param session_id: unique id of the browser session
+    :param version: running counter bumped on every portfolio mutation
+    :param portfolio: Portfolio to store
+    """
+    cache.set(f'ptf-{session_id}-{version}', portfolio)
+
+
+def load_ptf(session_id: str, version: int) -> Portfolio:
+    """
+    Fetch the cached portfolio for a (session, version) pair
+    :param session_id: unique id of the browser session
+    :param version: running counter bumped on every portfolio mutation
+    :return: cached Portfolio, or the startup portfolio if the entry was evicted
+    """
+    cached = cache.get(f'ptf-{session_id}-{version}')
+    if cached is None:  # the filesystem backend may evict entries past its threshold
+        # hand out a pristine copy: callbacks mutate the portfolio in place, and the
+        # startup object is shared by every session (and every thread)
+        cached = pickle.loads(pickle.dumps(ptf))
+    return cached
 
 
 def slider(i: int, ptf: Portfolio):
@@ -42,64 +76,101 @@ def slider(i: int, ptf: Portfolio):
                            'textAlign': 'center'})
 
 
+#   more points per trace than this just stall the browser without adding visible detail
+MAX_TRACE_POINTS = 1000
+
+
+def ticker_figure(scaled: pd.DataFrame):
+    """
+    Ticker comparison line figure, downsampled to what the browser can actually show
+    :param scaled: DataFrame of scaled asset prices
+    :return: figure shipping at most ~MAX_TRACE_POINTS points per trace
+    """
+    step = -(-len(scaled.index) // MAX_TRACE_POINTS)  # ceil division
+    if step > 1:
+        scaled = scaled.iloc[::step]
+    figure = px.line(scaled, title='Ticker revenue comparison')
+    figure.update_layout(yaxis_tickformat='%')
+    return figure
+
+
+#   Exposure pie grid skeleton, built (and schema-validated) once; callbacks only swap the data
+PIE_TEMPLATE = make_subplots(rows=1, cols=2, specs=[[{"type": "pie"}, {"type": "pie"}]])
+PIE_TEMPLATE.add_trace(go.Pie(name='Currency', title='Currency exposure'), row=1, col=1)
+PIE_TEMPLATE.add_trace(go.Pie(name='Sector', title='Sector exposure'), row=1, col=2)
+
+
+def pie_figure(currency_split: pd.DataFrame, sector_split: pd.Series):
+    """
+    Fill the prebuilt exposure pie template with fresh split data
+    :param currency_split: DataFrame of weight per currency
+    :param sector_split: Series of weight per sector
+    :return: figure w/ currency and sector exposure pies
+    """
+    figure = copy.copy(PIE_TEMPLATE)
+    figure.data[0].update(labels=currency_split.index, values=currency_split['weight'])
+    figure.data[1].update(labels=sector_split.index, values=sector_split.to_list())
+    return figure
+
+
 #   create default figs
-fig1 = px.line(scaled, title='Ticker revenue comparison')
-fig1.update_layout(yaxis_tickformat='%')
+fig1 = ticker_figure(scaled)
 fig2 = px.line(ptf.get_combined_worth(), title='Combined revenue')
 fig2.update_layout(yaxis_tickformat='%', showlegend=False)
-sector_split = ptf.get_sector_split()
-currency_split = ptf.get_currency_split()
-fig3 = make_subplots(rows=1, cols=2, specs=[[{"type": "pie"}, {"type": "pie"}]])
-fig3.add_trace(go.Pie(labels=currency_split.index, values=currency_split['weight'],
-                      name='Currency', title='Currency exposure'), row=1, col=1)
-fig3.add_trace(go.Pie(labels=sector_split.index, values=sector_split.to_list(),
-                      name='Sector', title='Sector exposure'), row=1, col=2)
+fig3 = pie_figure(ptf.get_currency_split(), ptf.get_sector_split())
 div2 = html.Div([dcc.Graph(figure=fig2), dcc.Graph(figure=fig3)])
 
+
 #   Configure HTML layout
-app.layout = html.Div([
-    html.Div([dcc.Input(id='ticker-name', type='text', placeholder='Insert ticker symbol'),
-              html.Button('Add', id='add-button'), html.Button('Remove', id='remove-button')]),
-    html.Div(id='all-assets',
-             children=[dcc.Graph(id='all-ticker-graph', figure=fig1),
-                       dcc.Slider(id='period-slider',
-                                  min=1, max=20, marks={1: {'label': '1 year'},
-                                                        5: {'label': '5 years'},
-                                                        10: {'label': '10 years'},
-                                                        20: {'label': '20 years'}},
-                                  value=ptf.period),
-                       html.Div(id='sliders', children=[slider(i, ptf) for i in range(len(w.index))])]),
-    html.Button('Update weights', id='update-button'),
-    html.Div(id='combined-graph', children=div2),
-    html.Div([html.Button('Save portfolio', id='save-button'), html.Div(id='save-confirmation')],
-             style={'display': 'inline-block'}),
-    # Data sharing within the app
-    html.Div(id='portfolio-data', children=[
-        html.Div(id='portfolio-finance', children=ptf.finance.to_json(), style={'display': 'none'}),
-        html.Div(id='portfolio-fund', children=ptf.summary.to_json(), style={'display': 'none'}),
-        html.Div(id='portfolio-period', children=ptf.period, style={'display': 'none'}),
-        html.Div(id='last_trigger', children=None, style={'display': 'none'})])
-])
+def serve_layout():
+    """Build the page layout and seed the cache for a fresh session"""
+    session_id = str(uuid.uuid4())
+    store_ptf(session_id, 0, ptf)
+    return html.Div([
+        html.Div([dcc.Input(id='ticker-name', type='text', placeholder='Insert ticker symbol'),
+                  html.Button('Add', id='add-button'), html.Button('Remove', id='remove-button')]),
+        html.Div(id='all-assets',
+                 children=[dcc.Graph(id='all-ticker-graph', figure=fig1),
+                           dcc.Slider(id='period-slider',
+                                      min=1, max=20, marks={1: {'label': '1 year'},
+                                                            5: {'label': '5 years'},
+                                                            10: {'label': '10 years'},
+                                                            20: {'label': '20 years'}},
+                                      value=ptf.period),
+                           html.Div(id='sliders', children=[slider(i, ptf) for i in range(len(w.index))])]),
+        html.Button('Update weights', id='update-button'),
+        html.Div(id='combined-graph', children=div2),
+        html.Div([html.Button('Save portfolio', id='save-button'), html.Div(id='save-confirmation')],
+                 style={'display': 'inline-block'}),
+        # Data sharing within the app
+        dcc.Store(id='session-id', data=session_id),
+        dcc.Store(id='version', data=0),
+        dcc.Store(id='last_trigger', data=None)
+    ])
+
+
+app.layout = serve_layout
 
 
 #   App callbacks
-@app.callback(Output('portfolio-data', 'children'),
+@app.callback([Output('version', 'data'),
+               Output('last_trigger', 'data')],
               [Input('add-button', 'n_clicks'),
                Input('remove-button', 'n_clicks'),
                Input('update-button', 'n_clicks'),
                Input('period-slider', 'value')],
-              [State('portfolio-finance', 'children'),
-               State('portfolio-fund', 'children'),
-               State('portfolio-period', 'children'),
+              [State('session-id', 'data'),
+               State('version', 'data'),
                State('ticker-name', 'value'),
                State({'type': 'slider', 'index': ALL}, 'value')])
-def update_assets(_1, _2, _3, period, finance, fund, cur_period, tick, *ws):
+def update_assets(_1, _2, _3, period, session_id, version, tick, *ws):
     """
     Update portfolio when adding an asset, removing an asset or updating the weights/ period
     """
-    finance = pd.read_json(finance); summary = pd.read_json(fund)
-    ptf = Portfolio(finance=finance, summary=summary, period=cur_period)
     changed_id = [p['prop_id'] for p in dash.callback_context.triggered][0]
+    if changed_id == '.':  # initial call, nothing actually changed
+        raise PreventUpdate
+    ptf = load_ptf(session_id, version)
     trigger = None
     if 'add' in changed_id:
         ptf.add(tick)
@@ -113,63 +184,45 @@ def update_assets(_1, _2, _3, period, finance, fund, cur_period, tick, *ws):
     elif 'period' in changed_id:
         ptf.update(period=period)
         trigger = 'period'
-    div = [
-        html.Div(id='portfolio-finance', children=ptf.finance.to_json(), style={'display': 'none'}),
-        html.Div(id='portfolio-fund', children=ptf.summary.to_json(), style={'display': 'none'}),
-        html.Div(id='portfolio-period', children=ptf.period, style={'display': 'none'}),
-        html.Div(id='last_trigger', children=trigger, style={'display': 'none'})]
-    return div
+    store_ptf(session_id, version + 1, ptf)
+    return version + 1, trigger
 
 
-@app.callback(Output('all-assets', 'children'), [Input('last_trigger', 'children')],
-              [State('portfolio-finance', 'children'),
-               State('portfolio-fund', 'children'),
-               State('portfolio-period', 'children'),
-               State('all-assets', 'children')])
-def update_multi_asset_objects(trigger, finance, fund, period, div):
+@app.callback(Output('all-assets', 'children'), [Input('last_trigger', 'data')],
+              [State('session-id', 'data'),
+               State('version', 'data')])
+def update_multi_asset_objects(trigger, session_id, version):
     """
     Update sliders and asset revenue comparison graph when asset list changes
     """
-    finance = pd.read_json(finance); summary = pd.read_json(fund)
-    ptf = Portfolio(finance=finance, summary=summary, period=period)
-    if trigger in ['add', 'remove', 'period']:
-        scaled = ptf.get_scaled_prices()
-        figure = px.line(scaled, title='Ticker revenue comparison')
-        figure.update_layout(yaxis_tickformat='%')
-        div = [dcc.Graph(id='all-ticker-graph', figure=figure),
-               dcc.Slider(id='period-slider',
-                          min=1, max=20, marks={1: {'label': '1 year'},
-                                                5: {'label': '5 years'},
-                                                10: {'label': '10 years'},
-                                                20: {'label': '20 years'}},
-                          value=ptf.period),
-               html.Div(id='sliders', children=[slider(i, ptf) for i in range(len(finance.columns))])]
-    return div
-
-
-@app.callback(Output('combined-graph', 'children'), [Input('last_trigger', 'children')],
-              [State('portfolio-finance', 'children'),
-               State('portfolio-fund', 'children'),
-               State('portfolio-period', 'children'),
-               State('combined-graph', 'children')])
-def update_combined_figures(trigger, finance, fund, period, div):
+    if trigger not in ['add', 'remove', 'period']:
+        raise PreventUpdate
+    ptf = load_ptf(session_id, version)
+    figure = ticker_figure(ptf.get_scaled_prices())
+    return [dcc.Graph(id='all-ticker-graph', figure=figure),
+            dcc.Slider(id='period-slider',
+                       min=1, max=20, marks={1: {'label': '1 year'},
+                                             5: {'label': '5 years'},
+                                             10: {'label': '10 years'},
+                                             20: {'label': '20 years'}},
+                       value=ptf.period),
+            html.Div(id='sliders', children=[slider(i, ptf) for i in range(ptf.finance.shape[1])])]
+
+
+@app.callback(Output('combined-graph', 'children'), [Input('last_trigger', 'data')],
+              [State('session-id', 'data'),
+               State('version', 'data')])
+def update_combined_figures(trigger, session_id, version):
     """
     Update combined worth graph and exposure pie charts
     """
-    finance = pd.read_json(finance); summary = pd.read_json(fund)
-    ptf = Portfolio(finance=finance, summary=summary, period=period)
-    if trigger is not None:
-        figure1 = px.line(ptf.get_combined_worth(), title='Combined revenue')
-        figure1.update_layout(yaxis_tickformat='%', showlegend=False)
-        sector_split = ptf.get_sector_split()
-        currency_split = ptf.get_currency_split()
-        figure2 = make_subplots(rows=1, cols=2, specs=[[{"type": "pie"}, {"type": "pie"}]])
-        figure2.add_trace(go.Pie(labels=currency_split.index, values=currency_split['weight'],
-                                 name='Currency', title='Currency exposure'), row=1, col=1)
-        figure2.add_trace(go.Pie(labels=sector_split.index, values=sector_split.to_list(),
-                                 name='Sector', title='Sector exposure'), row=1, col=2)
-        div = html.Div([dcc.Graph(figure=figure1), dcc.Graph(figure=figure2)])
-    return div
+    if trigger is None:
+        raise PreventUpdate
+    ptf = load_ptf(session_id, version)
+    figure1 = px.line(ptf.get_combined_worth(), title='Combined revenue')
+    figure1.update_layout(yaxis_tickformat='%', showlegend=False)
+    figure2 = pie_figure(ptf.get_currency_split(), ptf.get_sector_split())
+    return html.Div([dcc.Graph(figure=figure1), dcc.Graph(figure=figure2)])
 
 
 @app.callback(Output('ticker-name', 'value'), [Input('add-button', 'n_clicks'), Input('remove-button', 'n_clicks')])
@@ -181,21 +234,19 @@ def clear_input(_1, _2):
 
 
 @app.callback(Output('save-confirmation', 'children'), [Input('save-button', 'n_clicks')],
-              [State('portfolio-finance', 'children'),
-               State('portfolio-fund', 'children'),
-               State('portfolio-period', 'children')], prevent_initial_call=True)
-def save_content(_, finance, fund, period):
+              [State('session-id', 'data'),
+               State('version', 'data')], prevent_initial_call=True)
+def save_content(_, session_id, version):
     """
     Save portfolio to default portfolio.pkl file
     """
-    finance = pd.read_json(finance); summary = pd.read_json(fund)
-    ptf = Portfolio(finance=finance, summary=summary, period=period)
+    ptf = load_ptf(session_id, version)
     ptf.save_to_pickle('portfolio.pkl')
     return 'Portfolio successfully saved'
 
 
 if __name__ == "__main__":
-    app.run_server(debug=False)
+    app.run_server(debug=False, threaded=True)
 
 __author__ = "Sharon Katz"
 __email__ = 'sharonkats510@gmail.com'
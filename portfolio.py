@@ -1,34 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+import hashlib
+import os
+import time
 import numpy as np
 import pandas as pd
 import pickle
 import pandas_datareader.yahoo.daily as pdr
+import requests_cache
 import yahooquery as yq
 #
 
+# shared HTTP session so repeated price downloads are served from the local cache
+_session = requests_cache.CachedSession('yahoo_cache', expire_after=3600)
+
+# two-layer cache for fetched data: in-process dict backed by pickles under .cache/
+_CACHE_TTL = 24 * 3600
+_memory_cache = {}
+
+
+def _cache_key(*parts) -> str:
+    """Stable hash of the arguments identifying a fetch"""
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _cache_load(kind: str, key: str, ttl: int = _CACHE_TTL):
+    """
+    Look up a cached fetch result, first in memory then on disk
+    :param kind: cache subdirectory ('info', 'prices', ...)
+    :param key: key produced by _cache_key
+    :param ttl: maximum age of the on-disk copy in seconds
+    :return: cached object, or None on a miss
+    """
+    data = _memory_cache.get((kind, key))
+    if data is not None:
+        return data
+    path = os.path.join('.cache', kind, key + '.pkl')
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+        with open(path, 'rb') as fid:
+            data = pickle.load(fid)
+        _memory_cache[(kind, key)] = data
+    return data
+
+
+def _cache_store(kind: str, key: str, data):
+    """
+    Write a fetch result to both cache layers
+    :param kind: cache subdirectory ('info', 'prices', ...)
+    :param key: key produced by _cache_key
+    :param data: picklable object to store
+    """
+    _memory_cache[(kind, key)] = data
+    path = os.path.join('.cache', kind, key + '.pkl')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fid:
+        pickle.dump(data, fid, protocol=5)
+
 
 class Portfolio:
     """Bundle of assets with different weights"""
+    # lazy caches of derived data (class-level defaults keep old pickles loadable)
+    _scaled = None
+    _sector_weights = None
+    _currency_split = None
+    _w = None
+
     def __init__(self, tickers: list = None, period: int = 10, weights: list = None,
                  finance: pd.DataFrame = None, summary: pd.DataFrame = None):
         self.period = period
         if finance is not None:
-            self.finance = finance
+            self.finance = _as_column_major(finance)
             self.summary = summary
         elif tickers is not None:
-            self.finance = get_all_ticker_close(tickers, period)
-            self.summary = get_all_ticker_info(tickers)
-        if 'weight' not in self.summary.columns:
-            self.summary['weight'] = np.array(weights)/np.array(weights).sum() if weights else \
-                (1/self.summary.shape[0])*np.ones(self.summary.shape[0])
+            self.finance, self.summary = _fetch_ticker_data(tickers, period)
+        if weights:
+            self._set_weights(weights)
+        elif 'weight' not in self.summary.columns:
+            self._set_weights(np.ones(self.summary.shape[0]))
+
+    @property
+    def weights(self) -> np.ndarray:
+        """Normalized weight vector, kept as a float32 array for the numeric hot paths"""
+        if self._w is None:
+            self._w = self.summary['weight'].to_numpy(dtype=np.float32)
+        return self._w
+
+    def _set_weights(self, weights):
+        """
+        Normalize the given weights and store them both as an array and a summary column
+        :param weights: iterable of relative asset weights
+        """
+        w = np.asarray(weights, dtype=np.float32)
+        self._w = w / w.sum()
+        self.summary['weight'] = self._w
+
+    def _invalidate(self, prices: bool = True, tickers: bool = True):
+        """
+        Drop memoized derived data after a mutation
+        :param prices: whether the price data changed (not just the weights)
+        :param tickers: whether the set of assets changed
+        """
+        self._currency_split = None
+        self._w = None  # refilled lazily from the summary column
+        if prices:
+            self._scaled = None
+        if tickers:
+            self._sector_weights = None  # per-fund sector matrix only moves with the ticker set
+
+    def _get_scaled(self) -> pd.DataFrame:
+        """
+        Asset prices scaled to % of their first valid value, computed once per finance frame
+        :return: DataFrame of scaled prices keyed by ticker symbol
+        """
+        if self._scaled is None:
+            prices = self.finance.to_numpy()
+            first_valid = (~np.isnan(prices)).argmax(axis=0)
+            first_vals = prices[first_valid, np.arange(prices.shape[1])]
+            self._scaled = pd.DataFrame(prices / first_vals,
+                                        index=self.finance.index, columns=self.finance.columns).ffill()
+        return self._scaled
 
     def save_to_pickle(self, path: str):
         """
-        Read portfolio from pickle file
-        :param path: relative path to pickle file
+        Save portfolio to a pickle file, with the price frame stored as compressed parquet
+        :param path: relative path to pickle file (prices land next to it in <path>.parquet)
         """
+        self.finance.to_parquet(path + '.parquet', compression='zstd')
         with open(path, 'wb') as fid:
-            pickle.dump(self, fid)  # number of assets to load
+            pickle.dump({'summary': self.summary, 'period': self.period}, fid, protocol=5)
 
     def update(self, tickers: list = None, period: int = None, weights: list = None):
         """
@@ -38,16 +137,18 @@ class Portfolio:
         :param weights: list of weights corresponding to asset symbols
         :return: updated Portfolio
         """
+        refreshed = bool(tickers) or bool(period and period != self.period)
         if tickers:
-            self.finance = get_all_ticker_close(tickers, period or self.period)
-            self.summary = get_all_ticker_info(tickers)
-        elif period:
-            tickers = self.finance.columns
-            self.finance = get_all_ticker_close(tickers, period)
+            self.finance, self.summary = _fetch_ticker_data(tickers, period or self.period)
+        elif period and period != self.period:
+            self.finance = _as_column_major(get_all_ticker_close(self.finance.columns, period))
+        if period:
+            self.period = period
         if weights and (len(weights) == self.summary.shape[0]):
-            self.summary['weight'] = np.array(weights)/np.array(weights).sum()
+            self._set_weights(weights)
         elif 'weight' not in self.summary.columns:
-            self.summary['weight'] = (1/self.summary.shape[0])*np.ones(self.summary.shape[0])
+            self._set_weights(np.ones(self.summary.shape[0]))
+        self._invalidate(prices=refreshed, tickers=bool(tickers))
         return self
 
     def get_scaled_prices(self) -> pd.DataFrame:
@@ -55,18 +156,22 @@ class Portfolio:
         Scale asset prices to % of initial value
         :return: DataFrame of asset adjusted-scaled prices over the time period
         """
-        prices_scaled = self.finance.apply(lambda x: x / x[x.first_valid_index()], axis=0).fillna(method='ffill')
-        return prices_scaled.rename(columns=self.summary['name'].to_dict())
+        scaled = self._get_scaled()
+        names = [self.summary['name'].get(col, col) for col in scaled.columns]
+        # new frame over the cached buffer: relabelling via rename() would copy the whole matrix
+        return pd.DataFrame(scaled.to_numpy(), index=scaled.index, columns=names)
 
     def get_combined_worth(self) -> pd.DataFrame:
         """
         Extract Portfolio revenue relative to start point w/ respect to asset weights
         :return: Time series with worth as % of initial worth
         """
-        prices_scaled = self.finance.apply(lambda x: x / x[x.first_valid_index()], axis=0).fillna(method='ffill')
-        w = self.summary['weight']
-        w.index = prices_scaled.columns
-        return (prices_scaled * w.transpose()).sum(axis=1).to_frame(name='Combined value')
+        prices_scaled = np.nan_to_num(self._get_scaled().to_numpy())
+        if len(self.summary) == 1:  # degenerate shape: the combined worth is the single scaled asset
+            combined = prices_scaled.ravel()
+        else:
+            combined = prices_scaled @ self.weights
+        return pd.DataFrame(combined, index=self.finance.index, columns=['Combined value'])
 
     def remove(self, tick: str):
         """
@@ -77,7 +182,9 @@ class Portfolio:
         if tick in self.finance.columns:
             self.summary.drop(tick, axis=0, inplace=True)
             self.finance.drop(tick, axis=1, inplace=True)
-        return self.update()
+            self._set_weights(self.summary['weight'].to_numpy())  # renormalize the remaining assets
+            self._invalidate()
+        return self
 
     def add(self, tick: str):
         """
@@ -85,27 +192,76 @@ class Portfolio:
         :param tick: string object of asset symbol
         :return: updated Portfolio
         """
-        dat = get_all_ticker_close(tick, self.period).to_frame().rename(columns={'Adj Close': tick})
-        self.finance = self.finance.join(dat)
-        info = get_all_ticker_info(tick)
-        self.summary.drop('weight', axis=1, inplace=True)
-        self.summary = self.summary.append(info)
-        return self.update()
+        self.finance[tick] = get_all_ticker_close(tick, self.period).reindex(self.finance.index)
+        self.summary = pd.concat([self.summary.drop(columns='weight'), get_all_ticker_info(tick)])
+        for col in ('currency', 'exchange'):  # concat widens differing categories to object
+            self.summary[col] = self.summary[col].astype('category')
+        self._set_weights(np.ones(self.summary.shape[0]))  # back to equal weights, as before
+        self._invalidate()
+        return self
 
     def get_sector_split(self) -> pd.DataFrame:
         """
         Get sector distribution of portfolio w/ respect to weights
         """
-        query = yq.Ticker(self.summary['ticker'].to_list())
-        data = pd.DataFrame.from_dict(query.fund_sector_weightings)
-        mult = np.array(data) * np.array(self.summary['weight'].transpose())
-        return pd.Series(mult.sum(axis=1), index=data.index)
+        if self._sector_weights is None:
+            query = yq.Ticker(self.summary['ticker'].to_list(), asynchronous=True)
+            # async responses arrive in completion order; realign the columns with the summary rows
+            self._sector_weights = pd.DataFrame.from_dict(query.fund_sector_weightings) \
+                .reindex(columns=self.summary['ticker'].to_list())
+        if len(self.summary) == 1:  # single asset carries its sector weights unscaled
+            return self._sector_weights.iloc[:, 0]
+        return pd.Series(self._sector_weights.to_numpy() @ self.weights,
+                         index=self._sector_weights.index)
 
     def get_currency_split(self) -> pd.DataFrame:
         """
         Get currency distribution of portfolio w/ respect to weights
         """
-        return get_weighted_count(self.summary, 'currency')
+        if self._currency_split is None:
+            self._currency_split = get_weighted_count(self.summary, 'currency')
+        return self._currency_split
+
+    def all_cagrs(self) -> np.ndarray:
+        """
+        Compound annual growth rate of every asset over the time period, in one vectorized op
+        :return: array of CAGRs ordered like the finance columns
+        """
+        years = (self.finance.index[-1] - self.finance.index[0]).days / 365.0
+        start = self.finance.bfill().iloc[0].to_numpy()
+        end = self.finance.ffill().iloc[-1].to_numpy()
+        return (end / start) ** (1 / years) - 1
+
+    def cagr(self) -> float:
+        """
+        Weighted compound annual growth rate of the whole portfolio
+        """
+        return float(self.weights @ self.all_cagrs())
+
+
+def _fetch_ticker_data(tickers: str or list, period: int) -> tuple:
+    """
+    Download prices and fundamentals concurrently (both are blocking HTTP round-trips)
+    :param tickers: string or list of strings with asset symbols
+    :param period: time period in years
+    :return: tuple of (finance, summary) DataFrames
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prices = executor.submit(get_all_ticker_close, tickers, period)
+        info = executor.submit(get_all_ticker_info, tickers)
+        return _as_column_major(prices.result()), info.result()
+
+
+def _as_column_major(finance: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rebuild a price frame on a Fortran-ordered buffer so per-column math is cache friendly
+    :param finance: DataFrame of asset prices (one column per asset)
+    :return: same frame backed by a column-major (F-contiguous) array
+    """
+    if finance.ndim < 2 or finance.to_numpy().flags.f_contiguous:
+        return finance
+    return pd.DataFrame(np.asfortranarray(finance.to_numpy()),
+                        index=finance.index, columns=finance.columns)
 
 
 def get_all_ticker_close(tickers: str or list, period: int) -> pd.DataFrame:
@@ -115,11 +271,16 @@ def get_all_ticker_close(tickers: str or list, period: int) -> pd.DataFrame:
     :param period: Time period in years
     :return: DataFrame with time series/es of asset adjusted closing prices
     """
-    start_date = date.today().replace(year=date.today().year - period)
     end_date = date.today()
-    query = pdr.YahooDailyReader(tickers, start=start_date, end=end_date, interval='w')
-    data = query.read()
-    return data['Adj Close']
+    start_date = end_date.replace(year=end_date.year - period)
+    key = _cache_key(sorted(np.atleast_1d(tickers)), start_date, end_date, 'w')
+    cached = _cache_load('prices', key)
+    if cached is not None:
+        return cached.copy()
+    query = pdr.YahooDailyReader(tickers, start=start_date, end=end_date, interval='w', session=_session)
+    data = query.read()['Adj Close'].astype(np.float32)  # price precision doesn't warrant 8-byte floats
+    _cache_store('prices', key, data.copy())
+    return data
 
 
 def get_all_ticker_info(tickers: str or list) -> pd.DataFrame:
@@ -128,12 +289,21 @@ def get_all_ticker_info(tickers: str or list) -> pd.DataFrame:
     :param tickers: string or list of strings with asset symbols
     :return: DataFrame with the assets and the following characteristics: currency, ticker and name
     """
-    query = yq.Ticker(tickers)
-    currency = pd.DataFrame.from_dict(query.summary_detail).loc['currency', :]
-    data = pd.DataFrame.from_dict(query.quote_type).loc[['symbol', 'exchange', 'shortName'], :]
-    data = data.append(currency)
-    data.rename(index={'shortName': 'name', 'symbol': 'ticker'}, inplace=True)
-    return data.transpose()
+    symbols = np.atleast_1d(tickers)
+    key = _cache_key(sorted(symbols))
+    cached = _cache_load('info', key)
+    if cached is not None:
+        return cached.reindex(symbols)
+    query = yq.Ticker(tickers, asynchronous=True)
+    currency = pd.DataFrame.from_dict(query.summary_detail).loc[['currency'], :]
+    quote = pd.DataFrame.from_dict(query.quote_type).loc[['symbol', 'exchange', 'shortName'], :]
+    data = pd.concat([quote, currency]) \
+        .rename(index={'shortName': 'name', 'symbol': 'ticker'}).transpose()
+    data = data.reindex(symbols)  # the async fetch returns rows in completion order, not request order
+    for col in ('currency', 'exchange'):  # low-cardinality strings: group/hash on codes, not objects
+        data[col] = data[col].astype('category')
+    _cache_store('info', key, data.copy())  # callers mutate the summary, keep the cached copy pristine
+    return data
 
 
 def read_portfolio_from_pickle(path: str) -> Portfolio:
@@ -143,8 +313,11 @@ def read_portfolio_from_pickle(path: str) -> Portfolio:
     :return: Portfolio object
     """
     with open(path, 'rb') as fid:
-        portfolio = pickle.load(fid)
-    return portfolio
+        payload = pickle.load(fid)
+    if isinstance(payload, Portfolio):  # legacy format: the whole object in one pickle
+        return payload
+    return Portfolio(finance=pd.read_parquet(path + '.parquet'),
+                     summary=payload['summary'], period=payload['period'])
 
 
 def get_weighted_count(df: pd.DataFrame, column: str) -> pd.DataFrame:
@@ -152,12 +325,9 @@ def get_weighted_count(df: pd.DataFrame, column: str) -> pd.DataFrame:
     calculate distributions in data
     :param df: DataFrame with a column of the specified name, and a 'weight' colummn
     :param column: column name of the specific column in df
-    :return: dictionary where keys = unique values in df[column] , and values = sum(<index weight>*<appeared or not>)
+    :return: DataFrame where index = unique values in df[column] , and 'weight' = sum of their weights
     """
-    dic = dict()
-    for key in df[column].unique():
-        dic[key] = ((df[column] == key) * df['weight']).sum()
-    return pd.DataFrame.from_dict(dic, orient='index', columns=['weight'])
+    return df.groupby(column, sort=False, observed=True)['weight'].sum().to_frame(name='weight')
 
 
 __all__ = ['Portfolio', 'read_portfolio_from_pickle', 'get_all_ticker_info',